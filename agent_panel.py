@@ -1,10 +1,40 @@
 import streamlit as st
-import json
+import copy
+import msgspec
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from movie_tool import get_tools, query_movie_db
 from chart_tool import get_chart_tool, validate_chart
 
+_json_decoder = msgspec.json.Decoder()
+
+# Appended to the conversation when asking for alternatives. The request is
+# made without tools, so the tool schemas are not sent with it.
+ALTERNATIVES_REQUEST = {
+    "role": "user",
+    "content": "The user rejected your proposed action. Generate 3 different alternative approaches to answer their question. Each approach should use a meaningfully different strategy, tool usage pattern, or analysis method. Focus on diversity of approaches rather than minor variations."
+}
+
+
+# ── Models ──
+
+class Reasoning(BaseModel):
+    reason: str = Field(description="Your reasoning about what you know so far and what to do next")
+    use_tool: bool = Field(description="True if you need to run code or create a chart, False if you can give the final answer")
+    answer: Optional[str] = Field(default=None, description="Your final answer in one short paragraph. Only provide when use_tool is False.")
+
+class Alternative(BaseModel):
+    title: str = Field(description="A short, descriptive title for this approach (5-10 words)")
+    description: str = Field(description="A detailed explanation of this alternative approach and how it differs from the rejected action")
+    rationale: str = Field(description="Why this approach might work better or address the user's concerns")
+
+class Alternatives(BaseModel):
+    alternatives: List[Alternative] = Field(
+        description="3 meaningfully different alternative approaches the agent could take to solve the user's question",
+        min_length=3,
+        max_length=3
+    )
+
 
 # ── State ──
 
@@ -16,12 +46,19 @@ DEFAULT_STATE = {
     "agent_df": None,
     "agent_chart_specs": [],
     "agent_pending_message": None,
+    "agent_pending_args": {},
+    "agent_last_query_rows": None,
     "agent_alternatives": [],
     "selected_alternative": None,
+    "agent_full_run": True,
 }
 
 def get_state(key):
-    return st.session_state.get(key, DEFAULT_STATE[key])
+    # Store a copy of the default on first access: handing out the shared
+    # DEFAULT_STATE lists would leak appended items across sessions.
+    if key not in st.session_state:
+        st.session_state[key] = copy.copy(DEFAULT_STATE[key])
+    return st.session_state[key]
 
 def set_state(key, value):
     st.session_state[key] = value
@@ -31,6 +68,8 @@ def restart_agent(user_question, filtered_df, show_chart=False):
     set_state("agent_events", [])
     set_state("agent_chart_specs", [])
     set_state("agent_pending_message", None)
+    set_state("agent_pending_args", {})
+    set_state("agent_last_query_rows", None)
     set_state("agent_alternatives", [])
     set_state("selected_alternative", None)
 
@@ -38,7 +77,7 @@ def restart_agent(user_question, filtered_df, show_chart=False):
     system_content = "You are a data analyst with access to a tool that executes Python code on a movie database."
 
     if show_chart:
-        tools.append(get_chart_tool())
+        tools = tools + [get_chart_tool()]
         system_content += " After computing the data, create a chart using a Vega-Lite specification."
 
     set_state("agent_messages", [
@@ -51,20 +90,19 @@ def restart_agent(user_question, filtered_df, show_chart=False):
 
 # ── Logic ──
 
-def run_step(client):
+def run_step(client, thought_placeholder=None):
     phase = get_state("agent_phase")
     messages = get_state("agent_messages")
 
     if phase == "thinking":
-        class Reasoning(BaseModel):
-            reason: str = Field(description="Your reasoning about what you know so far and what to do next")
-            use_tool: bool = Field(description="True if you need to run code or create a chart, False if you can give the final answer")
-            answer: Optional[str] = Field(default=None, description="Your final answer in one short paragraph. Only provide when use_tool is False.")
-
-        response = client.chat.completions.parse(
+        # Stream the reasoning so the thought shows up while it is generated.
+        with client.chat.completions.stream(
             model="gpt-4o-mini", messages=messages, response_format=Reasoning,
-        )
-        reasoning = response.choices[0].message.parsed
+        ) as stream:
+            for event in stream:
+                if thought_placeholder is not None and event.type == "content.delta" and event.parsed:
+                    thought_placeholder.markdown(f"**Thought:** {event.parsed.get('reason', '')}")
+            reasoning = stream.get_final_completion().choices[0].message.parsed
         messages.append({"role": "assistant", "content": reasoning.reason})
 
         if reasoning.use_tool:
@@ -87,28 +125,38 @@ def run_step(client):
             return
 
         set_state("agent_pending_message", msg)
+        set_state("agent_pending_args", {
+            tc.id: _json_decoder.decode(tc.function.arguments) for tc in msg.tool_calls
+        })
         set_state("agent_phase", "awaiting_approval")
 
 def execute_pending_tools():
     messages = get_state("agent_messages")
     df = get_state("agent_df")
     pending_msg = get_state("agent_pending_message")
+    pending_args = get_state("agent_pending_args")
+    events = get_state("agent_events")
+    chart_specs = get_state("agent_chart_specs")
 
     messages.append(pending_msg)
     for tc in pending_msg.tool_calls:
-        args = json.loads(tc.function.arguments)
+        args = pending_args[tc.id]
 
         if tc.function.name == "QueryMovieDB":
-            result = query_movie_db(args["code"], df)
-            get_state("agent_events").append({
+            result, rows = query_movie_db(args["code"], df)
+            set_state("agent_last_query_rows", rows)
+            events.append({
                 "type": "action", "name": tc.function.name,
                 "code": args["code"], "result": result,
             })
         elif tc.function.name == "CreateChart":
-            spec, result = validate_chart(args["vega_lite_spec"])
+            spec, result = validate_chart(
+                args["vega_lite_spec"], args.get("data_from_last_query", False),
+                get_state("agent_last_query_rows"),
+            )
             if spec:
-                get_state("agent_chart_specs").append(spec)
-            get_state("agent_events").append({
+                chart_specs.append(spec)
+            events.append({
                 "type": "chart", "name": tc.function.name,
                 "spec_str": args["vega_lite_spec"], "result": result,
             })
@@ -116,11 +164,13 @@ def execute_pending_tools():
         messages.append({"role": "tool", "content": result, "tool_call_id": tc.id})
 
     set_state("agent_pending_message", None)
+    set_state("agent_pending_args", {})
     set_state("agent_phase", "thinking")
 
 def reject_pending_tools(feedback):
     messages = get_state("agent_messages")
     pending_msg = get_state("agent_pending_message")
+    events = get_state("agent_events")
 
     rejection_msg = "User rejected this action."
     if feedback:
@@ -128,13 +178,14 @@ def reject_pending_tools(feedback):
 
     messages.append(pending_msg)
     for tc in pending_msg.tool_calls:
-        get_state("agent_events").append({
+        events.append({
             "type": "rejected", "name": tc.function.name,
             "feedback": feedback,
         })
         messages.append({"role": "tool", "content": rejection_msg, "tool_call_id": tc.id})
 
     set_state("agent_pending_message", None)
+    set_state("agent_pending_args", {})
     set_state("agent_phase", "generating_alternatives")
 
 
@@ -142,23 +193,8 @@ def generate_alternatives(client):
     """Generate multiple alternative approaches when user rejects an action"""
     messages = get_state("agent_messages")
     
-    class Alternative(BaseModel):
-        title: str = Field(description="A short, descriptive title for this approach (5-10 words)")
-        description: str = Field(description="A detailed explanation of this alternative approach and how it differs from the rejected action")
-        rationale: str = Field(description="Why this approach might work better or address the user's concerns")
-    
-    class Alternatives(BaseModel):
-        alternatives: List[Alternative] = Field(
-            description="3 meaningfully different alternative approaches the agent could take to solve the user's question",
-            min_length=3,
-            max_length=3
-        )
-    
-    # Add a system message requesting alternatives
-    alt_messages = messages + [{
-        "role": "user",
-        "content": "The user rejected your proposed action. Generate 3 different alternative approaches to answer their question. Each approach should use a meaningfully different strategy, tool usage pattern, or analysis method. Focus on diversity of approaches rather than minor variations."
-    }]
+    # Add a user message requesting alternatives
+    alt_messages = messages + [ALTERNATIVES_REQUEST]
     
     response = client.chat.completions.parse(
         model="gpt-4o-mini",
@@ -232,8 +268,9 @@ def render_events():
 
 def render_pending_approval():
     st.warning("The agent wants to perform the following action:")
+    pending_args = get_state("agent_pending_args")
     for tc in get_state("agent_pending_message").tool_calls:
-        args = json.loads(tc.function.arguments)
+        args = pending_args[tc.id]
         st.markdown(f"**Tool:** `{tc.function.name}`")
         if tc.function.name == "QueryMovieDB":
             st.code(args["code"], language="python")
@@ -280,43 +317,37 @@ def render_panel():
     st.subheader("Analysis Results")
     container = st.container(height=600)
     actions = {}
+    thought_placeholder = None
     with container:
         phase = get_state("agent_phase")
 
         if phase == "idle":
             st.info("Enter a question and click 'Analyze' to see results.")
+            return actions, thought_placeholder
+
+        with st.expander("Agent Reasoning Trace", expanded=(phase != "done")):
+            render_events()
 
-        elif phase in ("thinking", "acting"):
-            with st.expander("Agent Reasoning Trace", expanded=True):
-                render_events()
+        if phase in ("thinking", "acting"):
+            thought_placeholder = st.empty()
             st.spinner("Agent is thinking...")
 
         elif phase == "awaiting_approval":
-            with st.expander("Agent Reasoning Trace", expanded=True):
-                render_events()
             approved, rejected = render_pending_approval()
             actions = {"approved": approved, "rejected": rejected}
 
         elif phase == "awaiting_feedback":
-            with st.expander("Agent Reasoning Trace", expanded=True):
-                render_events()
             submitted, feedback = render_pending_feedback()
             actions = {"submitted": submitted, "feedback": feedback}
         
         elif phase == "generating_alternatives":
-            with st.expander("Agent Reasoning Trace", expanded=True):
-                render_events()
             st.spinner("Generating alternative approaches...")
         
         elif phase == "selecting_alternative":
-            with st.expander("Agent Reasoning Trace", expanded=True):
-                render_events()
             selected = render_alternative_selection()
             actions = {"selected_alternative": selected}
 
         elif phase == "done":
-            with st.expander("Agent Reasoning Trace", expanded=False):
-                render_events()
             events = get_state("agent_events")
             if events and events[-1].get("answer"):
                 st.write("**Answer:**")
@@ -324,7 +355,7 @@ def render_panel():
             for spec in get_state("agent_chart_specs"):
                 st.vega_lite_chart(spec, use_container_width=True)
 
-    return actions
+    return actions, thought_placeholder
 
 
 # ── Lifecycle ──
@@ -332,28 +363,46 @@ def render_panel():
 def agent_panel(client, analyze_button, user_question, filtered_df, show_chart=False):
     # Phases: idle -> thinking <-> acting -> awaiting_approval -> awaiting_feedback 
     #         -> generating_alternatives -> selecting_alternative -> thinking ... -> done
+    # Restarting stays in the main script: fragment reruns reuse the last
+    # arguments, so they would replay a stale analyze_button.
     if analyze_button and user_question:
         restart_agent(user_question, filtered_df, show_chart)
 
-    actions = render_panel()
+    # Only full-app runs get here; fragment reruns go straight to the fragment.
+    set_state("agent_full_run", True)
+    agent_panel_fragment(client)
+
+
+@st.fragment
+def agent_panel_fragment(client):
+    # scope="fragment" is only allowed during a fragment rerun, and a full run
+    # can't hand over to one. So hops that follow a full-app run (e.g. thinking
+    # and acting right after Analyze) keep rerunning the whole app. Only once
+    # a click inside the panel (Approve, Reject, picking an alternative) has
+    # started a fragment rerun do the following hops rerun just this panel,
+    # skipping the sidebar and the dataset table.
+    scope = "app" if get_state("agent_full_run") else "fragment"
+    set_state("agent_full_run", False)
+
+    actions, thought_placeholder = render_panel()
 
     phase = get_state("agent_phase")
     if phase in ("thinking", "acting"):
-        run_step(client)
-        st.rerun()
+        run_step(client, thought_placeholder)
+        st.rerun(scope=scope)
     elif phase == "awaiting_approval":
         if actions.get("approved"):
             execute_pending_tools()
-            st.rerun()
+            st.rerun(scope=scope)
         elif actions.get("rejected"):
             set_state("agent_phase", "awaiting_feedback")
-            st.rerun()
+            st.rerun(scope=scope)
     elif phase == "awaiting_feedback" and actions.get("submitted"):
         reject_pending_tools(actions.get("feedback", ""))
-        st.rerun()
+        st.rerun(scope=scope)
     elif phase == "generating_alternatives":
         generate_alternatives(client)
-        st.rerun()
+        st.rerun(scope=scope)
     elif phase == "selecting_alternative" and actions.get("selected_alternative") is not None:
         apply_selected_alternative(actions.get("selected_alternative"))
-        st.rerun()
+        st.rerun(scope=scope)
@@ -1,5 +1,6 @@
 import os
 import streamlit as st
+import numpy as np
 import pandas as pd
 from openai import OpenAI
 from agent_panel import agent_panel
@@ -11,17 +12,80 @@ except Exception:
     load_dotenv()
     api_key = os.environ["OPENAI_API_KEY"]
 
-client = OpenAI(api_key=api_key)
+
+@st.cache_resource
+def get_client(api_key):
+    return OpenAI(api_key=api_key)
+
+
+client = get_client(api_key)
 
 st.set_page_config(page_title="Data Analysis Tool", layout="wide")
 st.title("Interactive Data Analysis Tool")
 
-df = pd.read_csv('movies.csv')
+
+@st.cache_data
+def load_movies():
+    return pd.read_csv('movies.csv')
+
+
+@st.cache_resource
+def load_filter_columns():
+    # The three filtered columns as standalone numpy arrays, so the filter
+    # pass never touches the DataFrame. Genre is stored as category codes, and
+    # years and ratings use narrow dtypes to cut the bytes each comparison
+    # reads. filter_movies casts the bounds to match.
+    df = load_movies()
+    genre = pd.Categorical(df['Genre'])
+    return {
+        'genre_codes': genre.codes,
+        'genre_categories': genre.categories,
+        'year': df['Release Year'].to_numpy(np.int16),
+        'rating': df['IMDB Rating'].to_numpy(np.float32),
+    }
+
+
+@st.cache_data
+def filter_movies(columns, genres, year_range, rating_range):
+    arrays = load_filter_columns()
+    mask = np.ones(len(arrays['year']), dtype=bool)
+
+    if genres is not None:
+        codes = arrays['genre_categories'].get_indexer(genres)
+        mask &= np.isin(arrays['genre_codes'], codes[codes >= 0])
+
+    if year_range is not None:
+        years = arrays['year']
+        lo, hi = np.asarray(year_range, dtype=years.dtype)
+        mask &= (years >= lo) & (years <= hi)
+
+    if rating_range is not None:
+        ratings = arrays['rating']
+        lo, hi = np.asarray(rating_range, dtype=ratings.dtype)
+        mask &= (ratings >= lo) & (ratings <= hi)
+
+    return load_movies()[list(columns)].iloc[np.nonzero(mask)[0]]
+
+
+@st.cache_data
+def column_stats():
+    # Widget options and slider bounds come from the full dataset, so they
+    # only need computing once.
+    df = load_movies()
+    return {
+        'columns': df.columns.tolist(),
+        'genres': df['Genre'].dropna().unique().tolist(),
+        'year': (int(df['Release Year'].min()), int(df['Release Year'].max())),
+        'rating': (float(df['IMDB Rating'].min()), float(df['IMDB Rating'].max())),
+    }
+
+
+stats = column_stats()
 
 with st.sidebar:
     st.header("Data Filters")
 
-    all_columns = df.columns.tolist()
+    all_columns = stats['columns']
     selected_columns = st.multiselect(
         "Select columns to include:",
         all_columns,
@@ -32,46 +96,43 @@ with st.sidebar:
         st.error("Please select at least one column.")
         st.stop()
 
-    filtered_df = df[selected_columns]
-
     st.subheader("Row Filters")
 
-    if 'Genre' in filtered_df.columns:
-        genres = filtered_df['Genre'].dropna().unique()
+    selected_genres = None
+    if 'Genre' in selected_columns:
+        genres = stats['genres']
         selected_genres = st.multiselect(
             "Filter by Genre:",
             genres,
-            default=genres.tolist()
+            default=genres
         )
-        filtered_df = filtered_df[filtered_df['Genre'].isin(selected_genres)]
 
-    if 'Release Year' in filtered_df.columns:
-        min_year = int(filtered_df['Release Year'].min())
-        max_year = int(filtered_df['Release Year'].max())
+    year_range = None
+    if 'Release Year' in selected_columns:
+        min_year, max_year = stats['year']
         year_range = st.slider(
             "Filter by Release Year:",
             min_year,
             max_year,
             (min_year, max_year)
         )
-        filtered_df = filtered_df[
-            (filtered_df['Release Year'] >= year_range[0]) &
-            (filtered_df['Release Year'] <= year_range[1])
-        ]
-
-    if 'IMDB Rating' in filtered_df.columns:
-        min_rating = float(filtered_df['IMDB Rating'].min())
-        max_rating = float(filtered_df['IMDB Rating'].max())
+
+    rating_range = None
+    if 'IMDB Rating' in selected_columns:
+        min_rating, max_rating = stats['rating']
         rating_range = st.slider(
             "Filter by IMDB Rating:",
             min_rating,
             max_rating,
             (min_rating, max_rating)
         )
-        filtered_df = filtered_df[
-            (filtered_df['IMDB Rating'] >= rating_range[0]) &
-            (filtered_df['IMDB Rating'] <= rating_range[1])
-        ]
+
+    filtered_df = filter_movies(
+        tuple(selected_columns),
+        tuple(selected_genres) if selected_genres is not None else None,
+        year_range,
+        rating_range,
+    )
 
 col1, col2 = st.columns([1, 1])
 
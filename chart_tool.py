@@ -1,29 +1,46 @@
 from openai import pydantic_function_tool
 from pydantic import BaseModel, Field
-import altair as alt
-import json
+import msgspec
+
+_json_decoder = msgspec.json.Decoder()
 
 
 class CreateChart(BaseModel):
     """Create a chart visualization using a Vega-Lite specification."""
-    vega_lite_spec: str = Field(description="A complete Vega-Lite JSON specification string, including inline data under 'data.values'.")
+    vega_lite_spec: str = Field(description="A complete Vega-Lite JSON specification string. Leave out 'data' when data_from_last_query is true; otherwise include inline data under 'data.values'.")
+    data_from_last_query: bool = Field(description="True to chart the rows of the `chart_data` DataFrame from the last QueryMovieDB call instead of inlining data.")
+
+
+CHART_TOOL = pydantic_function_tool(
+    CreateChart,
+    description="Create a visualization by providing a Vega-Lite JSON specification. Prefer setting data_from_last_query so the rows of the last query's `chart_data` DataFrame are filled in for you, rather than copying data into 'data.values'. Use this when the user asks for a visualization, chart, plot, or graph."
+)
 
 
 def get_chart_tool():
-    return pydantic_function_tool(
-        CreateChart,
-        description="Create a visualization by providing a Vega-Lite JSON specification. The data should be included inline in the spec under the 'data.values' field. Use this when the user asks for a visualization, chart, plot, or graph."
-    )
+    return CHART_TOOL
 
 
-def validate_chart(vega_lite_spec):
+def validate_chart(vega_lite_spec, data_from_last_query=False, last_query_rows=None):
     try:
-        spec = json.loads(vega_lite_spec)
-    except json.JSONDecodeError as e:
+        spec = _json_decoder.decode(vega_lite_spec)
+    except msgspec.DecodeError as e:
         return None, f"Invalid JSON: {e}"
 
+    if data_from_last_query:
+        if last_query_rows is None:
+            return None, "No query result to chart. Assign a DataFrame to `chart_data` in QueryMovieDB first."
+        if not isinstance(spec, dict):
+            return None, "Invalid Vega-Lite specification: expected a JSON object."
+        spec["data"] = {"values": last_query_rows}
+
+    # Validate against the root Vega-Lite schema in a single jsonschema pass.
+    # Chart.from_dict would also build the full chart object tree, and tries
+    # each top-level chart class in turn before falling back to Root.
+    # altair is imported here since nothing else in the app needs it.
+    from altair import Root
     try:
-        alt.Chart.from_dict(spec)
+        Root.validate(spec)
         return spec, "Valid Vega-Lite specification."
     except Exception as e:
         return None, f"Invalid Vega-Lite specification: {e}"
@@ -1,7 +1,56 @@
 from openai import pydantic_function_tool
 from pydantic import BaseModel, Field
-import subprocess
+import ast
+import ctypes
+import functools
+import io
+import msgspec
 import sys
+import threading
+import traceback
+import numpy as np
+import pandas as pd
+
+TIMEOUT_SECONDS = 10
+
+# Cheap guard against generated code reaching outside the DataFrame. Not a
+# sandbox, but it catches the obvious cases before anything runs.
+FORBIDDEN_MODULES = {"os", "sys", "subprocess", "shutil", "socket", "pathlib"}
+FORBIDDEN_CALLS = {"open", "exec", "eval", "compile", "__import__"}
+# Tool code shares the app's pd and np modules, so these would change
+# settings for every later call and every other session.
+FORBIDDEN_SETTINGS = {"set_option", "reset_option", "set_printoptions", "seed"}
+
+
+class _ThreadStdout:
+    """sys.stdout stand-in that sends each tool worker's prints to its own buffer.
+
+    contextlib.redirect_stdout swaps sys.stdout for the whole process, so with
+    several sessions (or a timed-out worker still running) prints would land in
+    the wrong buffer. Threads without a buffer write to the real stdout.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def _target(self):
+        buffer = getattr(self.local, "buffer", None)
+        return self.default if buffer is None else buffer
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+# Unwrap first so a Streamlit module reload doesn't stack proxies.
+_stdout = _ThreadStdout(getattr(sys.stdout, "default", sys.stdout))
+sys.stdout = _stdout
 
 
 def get_dataframe_schema(df):
@@ -14,39 +63,133 @@ def get_dataframe_schema(df):
 
 class QueryMovieDB(BaseModel):
     """Query the movie database using Python code."""
-    code: str = Field(description="Python code to execute. Must use print() to output results.")
+    code: str = Field(description="Python code to execute. Must use print() to output results. Assign a DataFrame to `chart_data` to make it available as chart data.")
+
+
+# The parameters schema never changes, so build the tool once and only fill
+# in the description (which embeds the DataFrame schema) per call.
+_QUERY_TOOL = pydantic_function_tool(QueryMovieDB)
+
+
+@functools.lru_cache(maxsize=32)
+def _query_tool(schema):
+    return {
+        **_QUERY_TOOL,
+        "function": {
+            **_QUERY_TOOL["function"],
+            "description": f"Execute Python code to query the movie database. The DataFrame `df` is pre-loaded. Always use print() to output results. To chart a computed table, assign it as a DataFrame to a variable named `chart_data`.\n\nSchema:\n{schema}",
+        },
+    }
 
 
 def get_tools(filtered_df):
-    schema = get_dataframe_schema(filtered_df)
-    return [pydantic_function_tool(
-        QueryMovieDB,
-        description=f"Execute Python code to query the movie database. The DataFrame `df` is pre-loaded. Always use print() to output results.\n\nSchema:\n{schema}"
-    )]
+    return [_query_tool(get_dataframe_schema(filtered_df))]
 
 
-def query_movie_db(code, filtered_df):
-    filtered_df.to_csv('temp_data.csv', index=False)
+def _attribute_chain(node):
+    names = []
+    while isinstance(node, ast.Attribute):
+        names.append(node.attr)
+        node = node.value
+    return names
+
+
+def _find_forbidden(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""]
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id in FORBIDDEN_CALLS | FORBIDDEN_SETTINGS:
+                return f"{node.func.id}()"
+            continue
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            if node.func.attr in FORBIDDEN_SETTINGS:
+                return f"{node.func.attr}()"
+            continue
+        elif isinstance(node, ast.Attribute) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            if "options" in _attribute_chain(node):
+                return "changing pandas options"
+            continue
+        else:
+            continue
+        for module in modules:
+            if module.split(".")[0] in FORBIDDEN_MODULES:
+                return f"import {module}"
+    return None
 
-    full_code = f"""import pandas as pd
-import numpy as np
 
-df = pd.read_csv('temp_data.csv')
+@functools.lru_cache(maxsize=256)
+def _compile_code(code):
+    tree = ast.parse(code, "<tool>")
+    forbidden = _find_forbidden(tree)
+    if forbidden:
+        raise ValueError(f"Forbidden in tool code: {forbidden}")
+    return compile(tree, "<tool>", "exec")
 
-{code}"""
 
-    with open("generated_code.py", "w") as f:
-        f.write(full_code)
+def _run_code(compiled, namespace, stdout, errors):
+    _stdout.local.buffer = stdout
+    try:
+        exec(compiled, namespace)
+    except BaseException as e:
+        # Skip this function's own frame so only <tool> frames reach the agent.
+        errors.append("".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next)))
+    finally:
+        _stdout.local.buffer = None
+
+
+def _chart_rows(chart_data):
+    """Convert a `chart_data` DataFrame or Series left by the code to JSON-ready row dicts."""
+    if isinstance(chart_data, pd.Series):
+        chart_data = chart_data.reset_index()
+    if not isinstance(chart_data, pd.DataFrame):
+        return None
+    # to_json maps NaN to null and numpy scalars to plain numbers.
+    return msgspec.json.decode(chart_data.to_json(orient="records"))
+
+
+def query_movie_db(code, filtered_df):
+    """Run the code and return (output, rows), where rows come from a `chart_data`
+    DataFrame the code assigned, or None."""
+    # Reject code that does not parse, or is forbidden, before starting a worker.
+    try:
+        compiled = _compile_code(code)
+    except SyntaxError as e:
+        return f"SyntaxError: {e}", None
+    except ValueError as e:
+        return str(e), None
+
+    # Run in-process on a worker thread so pandas stays imported and the
+    # DataFrame never has to be written out and re-parsed.
+    stdout = io.StringIO()
+    errors = []
+    namespace = {"df": filtered_df.copy(), "pd": pd, "np": np}
 
-    result = subprocess.run(
-        [sys.executable, "generated_code.py"],
-        capture_output=True,
-        text=True,
-        timeout=10
-    )
+    worker = threading.Thread(target=_run_code, args=(compiled, namespace, stdout, errors), daemon=True)
+    worker.start()
+    worker.join(TIMEOUT_SECONDS)
 
-    if result.returncode != 0:
-        return result.stderr
-    if not result.stdout.strip():
-        return "No output. Did you forget to use print()?"
-    return result.stdout
+    if worker.is_alive():
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(worker.ident), ctypes.py_object(TimeoutError)
+        )
+        return f"Execution timed out after {TIMEOUT_SECONDS} seconds.", None
+    if errors:
+        return errors[0], None
+    # Model code can leave frames that don't convert (e.g. duplicate column
+    # names), so report the problem instead of letting it escape.
+    try:
+        rows = _chart_rows(namespace.get("chart_data"))
+        note = ""
+    except Exception as e:
+        rows = None
+        note = f"\nCould not use `chart_data` as chart rows: {e}"
+    output = stdout.getvalue()
+    if not output.strip():
+        if rows is not None:
+            output = f"No output. `chart_data` holds {len(rows)} rows for charting."
+        else:
+            output = "No output. Did you forget to use print()?"
+    return output + note, rows